@@ -1,20 +1,31 @@
-from fastapi import FastAPI, HTTPException, Depends, status, APIRouter
+from fastapi import FastAPI, HTTPException, Depends, APIRouter, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from starlette.datastructures import Headers, MutableHeaders
 from motor.motor_asyncio import AsyncIOMotorClient
 from pydantic import BaseModel, Field, EmailStr
 from typing import List, Optional, Dict, Any
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 import os
 import uuid
 import logging
-from pathlib import Path
-import json
+import time
 import asyncio
-from collections import defaultdict
-import aiohttp
+import math
+import random
+from contextvars import ContextVar
+from pathlib import Path
+from pymongo import DeleteMany, ReplaceOne, monitoring
+from pymongo.errors import DuplicateKeyError
 from dotenv import load_dotenv
 
+# Startup profile: phase name -> seconds, logged once the app has started.
+# Phases are timed from here on; for a per-module breakdown of the imports
+# (fastapi, pydantic, motor, pymongo, ...) run from backend/:
+#   python -X importtime -c "import server"
+_STARTED_AT = time.perf_counter()
+startup_timings: Dict[str, float] = {}
+
 # Load environment variables
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -23,22 +34,198 @@ load_dotenv(ROOT_DIR / '.env')
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Query profiling
+# QUERY_PROFILE_SAMPLE_RATE: fraction of requests profiled (0 disables sampling).
+# QUERY_PROFILE_ALLOW_HEADER: let a request opt in with "X-Query-Profile: true";
+# off by default since profiled slow commands trigger an extra explain.
+# SLOW_QUERY_MS: commands slower than this are logged, with their plan when profiled.
+# QUERY_PROFILE_SERVER_TIMING: add a Server-Timing header to profiled responses;
+# off by default as it exposes collection names and timings.
+def is_truthy(value: Optional[str]) -> bool:
+    """Parse a boolean env var or header value (1/true/yes/on)"""
+    return (value or "").strip().lower() in ("1", "true", "yes", "on")
+
+QUERY_PROFILE_SAMPLE_RATE = float(os.environ.get('QUERY_PROFILE_SAMPLE_RATE', '0'))
+QUERY_PROFILE_ALLOW_HEADER = is_truthy(os.environ.get('QUERY_PROFILE_ALLOW_HEADER'))
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+QUERY_PROFILE_SERVER_TIMING = is_truthy(os.environ.get('QUERY_PROFILE_SERVER_TIMING'))
+
+# Commands MongoDB can explain; the rest (insert, getMore, ...) are only timed
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+
+class QueryProfile:
+    """Mongo commands issued while handling a single request"""
+
+    def __init__(self):
+        self.commands: List[Dict[str, Any]] = []
+        self._pending: Dict[Any, Dict[str, Any]] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        command = None
+        if event.command_name in EXPLAINABLE_COMMANDS:
+            command = {k: v for k, v in event.command.items()
+                       if not k.startswith('$') and k not in ('lsid', 'txnNumber')}
+        self._pending[(event.connection_id, event.request_id)] = {
+            "command": event.command_name,
+            # getMore carries the cursor id under its name and the collection separately
+            "collection": event.command.get(
+                'collection' if event.command_name == "getMore" else event.command_name
+            ),
+            "spec": command,
+        }
+
+    def finished(self, event, failed: bool = False):
+        entry = self._pending.pop((event.connection_id, event.request_id), None)
+        if entry is None:
+            return
+        entry["duration_ms"] = event.duration_micros / 1000
+        entry["failed"] = failed
+        self.commands.append(entry)
+
+    @property
+    def total_ms(self) -> float:
+        return sum(entry["duration_ms"] for entry in self.commands)
+
+    def server_timing(self) -> str:
+        """Server-Timing header value: the total plus one metric per command"""
+        metrics = [f'mongo;dur={self.total_ms:.1f};desc="{len(self.commands)} commands"']
+        for i, entry in enumerate(self.commands):
+            metrics.append(
+                f'mongo-{i};dur={entry["duration_ms"]:.1f};desc="{entry["command"]} {entry["collection"]}"'
+            )
+        return ", ".join(metrics)
+
+current_query_profile: ContextVar[Optional[QueryProfile]] = ContextVar('current_query_profile', default=None)
+
+class QueryProfiler(monitoring.CommandListener):
+    """Records Mongo commands into the active request's QueryProfile
+
+    Motor runs PyMongo on a thread pool with the caller's context copied, so
+    the profile set by the request middleware is visible here.
+    """
+
+    def started(self, event):
+        profile = current_query_profile.get()
+        if profile is not None:
+            profile.started(event)
+
+    def succeeded(self, event):
+        self._finished(event, failed=False)
+
+    def failed(self, event):
+        self._finished(event, failed=True)
+
+    def _finished(self, event, failed: bool):
+        profile = current_query_profile.get()
+        if profile is not None:
+            profile.finished(event, failed)
+        elif event.duration_micros / 1000 >= SLOW_QUERY_MS:
+            logger.warning(f"Slow query: {event.command_name} took {event.duration_micros / 1000:.1f}ms")
+
+def summarize_plan(explain_result: dict) -> str:
+    """Winning plan stages, outermost first, e.g. FETCH>IXSCAN or COLLSCAN"""
+    planner = explain_result.get('queryPlanner')
+    if planner is None:
+        # Aggregations nest the planner under their first ($cursor) stage
+        for stage in explain_result.get('stages', []):
+            planner = stage.get('$cursor', {}).get('queryPlanner')
+            if planner:
+                break
+    if not planner:
+        return "unknown"
+    stages = []
+    pending = [planner.get('winningPlan', {})]
+    while pending:
+        plan = pending.pop(0)
+        plan = plan.get('queryPlan', plan)
+        if 'stage' in plan:
+            stages.append(plan['stage'])
+        if 'inputStage' in plan:
+            pending.append(plan['inputStage'])
+        pending.extend(plan.get('inputStages', []))
+    return ">".join(stages) or "unknown"
+
+async def log_slow_queries(method: str, path: str, profile: QueryProfile):
+    """Explain and log the commands of a profiled request that exceeded SLOW_QUERY_MS"""
+    for entry in profile.commands:
+        if entry["duration_ms"] < SLOW_QUERY_MS:
+            continue
+        plan = "n/a"
+        if entry["spec"] is not None:
+            try:
+                result = await get_db().command({"explain": entry["spec"], "verbosity": "queryPlanner"})
+                plan = summarize_plan(result)
+            except Exception as e:
+                plan = f"explain failed: {e}"
+        logger.warning(
+            f"Slow query in {method} {path}: {entry['command']} {entry['collection']} "
+            f"took {entry['duration_ms']:.1f}ms, plan={plan}"
+        )
 
-app = FastAPI(title="TrailMeet API", description="API for outdoor events and adventures")
-api_router = APIRouter(prefix="/api")
+# Keeps references to fire-and-forget slow-query tasks until they finish
+_slow_query_tasks: set = set()
+
+class QueryProfilerMiddleware:
+    """ASGI middleware profiling the Mongo commands of sampled or opted-in requests
+
+    Plain ASGI rather than BaseHTTPMiddleware, so requests that are not
+    profiled go straight to the inner app.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def should_profile(self, scope) -> bool:
+        if random.random() < QUERY_PROFILE_SAMPLE_RATE:
+            return True
+        return QUERY_PROFILE_ALLOW_HEADER and is_truthy(Headers(scope=scope).get('x-query-profile'))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = QueryProfile()
 
-# CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and QUERY_PROFILE_SERVER_TIMING:
+                MutableHeaders(scope=message).append('Server-Timing', profile.server_timing())
+            await send(message)
+
+        token = current_query_profile.set(profile)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_query_profile.reset(token)
+
+        method, path = scope["method"], scope["path"]
+        logger.info(
+            f"Query profile {method} {path}: "
+            f"{len(profile.commands)} commands, {profile.total_ms:.1f}ms"
+        )
+        if any(entry["duration_ms"] >= SLOW_QUERY_MS for entry in profile.commands):
+            # Explains run outside the request context so they are not profiled themselves
+            task = asyncio.create_task(log_slow_queries(method, path, profile))
+            _slow_query_tasks.add(task)
+            task.add_done_callback(_slow_query_tasks.discard)
+
+query_profiler = QueryProfiler()
+
+# MongoDB connection (created lazily on first use, not at import time)
+_client: Optional[AsyncIOMotorClient] = None
+_db = None
+
+def get_db():
+    """Return the MongoDB database, connecting on first call"""
+    global _client, _db
+    if _db is None:
+        connect_started = time.perf_counter()
+        _client = AsyncIOMotorClient(os.environ['MONGO_URL'], event_listeners=[query_profiler])
+        _db = _client[os.environ['DB_NAME']]
+        startup_timings['mongo_client'] = time.perf_counter() - connect_started
+    return _db
+
+api_router = APIRouter(prefix="/api")
 
 # Security
 security = HTTPBearer(auto_error=False)
@@ -132,13 +319,235 @@ def parse_from_mongo(item: dict) -> dict:
             pass
     return item
 
+# "Upcoming near me" index
+# upcoming_events holds one entry per active upcoming event: its geohash
+# prefixes (cells) and UTC event_date, indexed on (cells, event_date). A
+# nearby query covers the circle's bounding box with a handful of cells and
+# reads them in event_date order from now on, so it touches only upcoming
+# entries close to the user however many events exist.
+GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+UPCOMING_PRECISIONS = range(1, 8)  # ~5000km down to ~150m cells
+MAX_NEARBY_CELLS = 16  # finest precision whose cover stays within this many cells
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+def geohash_encode(lat: float, lng: float, precision: int) -> str:
+    """Geohash of a point at the given precision"""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+def geohash_cell_size(precision: int) -> tuple:
+    """(height, width) of a geohash cell in degrees"""
+    total_bits = 5 * precision
+    lng_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+def geohash_cover(lat: float, lng: float, radius_km: float, precision: int,
+                  max_cells: Optional[int] = None) -> Optional[List[str]]:
+    """Geohash cells covering the bounding box of a circle
+
+    Longitudes wrap at the antimeridian, and a box reaching a pole spans
+    every longitude. Returns None when the cover would exceed max_cells.
+    """
+    height, width = geohash_cell_size(precision)
+    rows, cols = round(180.0 / height), round(360.0 / width)
+
+    dlat = radius_km / KM_PER_DEGREE
+    lat_min, lat_max = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+    first_row = math.floor((lat_min + 90.0) / height)
+    last_row = min(math.floor((lat_max + 90.0) / height), rows - 1)
+
+    # Longitude span is widest at the most poleward latitude of the box
+    cos_lat = math.cos(math.radians(max(abs(lat_min), abs(lat_max))))
+    if cos_lat < 1e-9 or radius_km / (KM_PER_DEGREE * cos_lat) >= 180.0:
+        first_col, last_col = 0, cols - 1
+    else:
+        dlng = radius_km / (KM_PER_DEGREE * cos_lat)
+        first_col = math.floor((lng - dlng + 180.0) / width)
+        last_col = min(math.floor((lng + dlng + 180.0) / width), first_col + cols - 1)
+
+    if max_cells is not None and (last_row - first_row + 1) * (last_col - first_col + 1) > max_cells:
+        return None
+    return [
+        geohash_encode(-90.0 + (row + 0.5) * height, -180.0 + (col % cols + 0.5) * width, precision)
+        for row in range(first_row, last_row + 1)
+        for col in range(first_col, last_col + 1)
+    ]
+
+def nearby_cells(lat: float, lng: float, radius_km: float) -> List[str]:
+    """Cells to search for a circle: the finest cover of at most MAX_NEARBY_CELLS
+
+    Falls back to the (complete) coarsest cover when no finer one is small enough.
+    """
+    for precision in reversed(UPCOMING_PRECISIONS):
+        cells = geohash_cover(lat, lng, radius_km, precision, MAX_NEARBY_CELLS)
+        if cells is not None:
+            return cells
+    return geohash_cover(lat, lng, radius_km, UPCOMING_PRECISIONS[0])
+
+def distance_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle (haversine) distance between two points"""
+    dlat = math.radians(lat2 - lat1)
+    dlng = math.radians(lng2 - lng1)
+    a = (math.sin(dlat / 2) ** 2
+         + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlng / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+def upcoming_entry(event: dict) -> Optional[dict]:
+    """upcoming_events entry for an event as stored in MongoDB, None if it is not upcoming"""
+    event = parse_from_mongo(dict(event))
+    event_date = event.get('event_date')
+    if event.get('status') != "active" or not isinstance(event_date, datetime):
+        return None
+    if event_date.tzinfo is None:
+        event_date = event_date.replace(tzinfo=timezone.utc)
+    event_date = event_date.astimezone(timezone.utc)
+    if event_date < datetime.now(timezone.utc):
+        return None
+    location = event['location']
+    geohash = geohash_encode(location['lat'], location['lng'], max(UPCOMING_PRECISIONS))
+    return {
+        "event_id": event['id'],
+        "cells": [geohash[:precision] for precision in UPCOMING_PRECISIONS],
+        "lat": location['lat'],
+        "lng": location['lng'],
+        "event_date": event_date,
+    }
+
+async def refresh_upcoming_index(event: dict):
+    """Add, update or drop an event's upcoming_events entry after it changed"""
+    entry = upcoming_entry(event)
+    if entry is None:
+        await remove_from_upcoming_index(event['id'])
+    else:
+        await get_db().upcoming_events.replace_one({"event_id": event['id']}, entry, upsert=True)
+
+async def remove_from_upcoming_index(event_id: str):
+    await get_db().upcoming_events.delete_one({"event_id": event_id})
+
+# Reconcile runs at most once per interval across all workers, guarded by a
+# lease in the locks collection; past entries are pruned by a TTL index.
+UPCOMING_RECONCILE_INTERVAL_S = float(os.environ.get('UPCOMING_RECONCILE_INTERVAL_S', '3600'))
+UPCOMING_RECONCILE_LOCK = "upcoming_events_reconcile"
+WORKER_ID = str(uuid.uuid4())  # identifies this worker as a lease holder
+UPCOMING_EVENT_FIELDS = {"_id": 0, "id": 1, "status": 1, "event_date": 1, "location": 1}
+
+async def _upcoming_entries(query: dict) -> Dict[str, dict]:
+    """upcoming_events entries, by event id, for the active upcoming events matching query"""
+    entries = {}
+    async for event in get_db().events.find({**query, "status": "active"}, UPCOMING_EVENT_FIELDS):
+        try:
+            entry = upcoming_entry(event)
+        except Exception as e:
+            logger.warning(f"Skipping event {event.get('id')} in upcoming events index: {e}")
+            continue
+        if entry is not None:
+            entries[entry['event_id']] = entry
+    return entries
+
+async def reconcile_upcoming_index() -> tuple:
+    """Bring upcoming_events in line with the events collection
+
+    Compares event ids: upserts active upcoming events that are missing (or
+    stored with another cell layout) and deletes entries for past, inactive
+    or deleted events. Returns (upserted, deleted).
+
+    Workers keep serving while this runs, so the ids found to differ are
+    re-read from events right before writing (an event created after the
+    first scan is not deleted, one deleted since is not upserted), and
+    upserted ids are checked again afterwards in case their event was
+    deleted while the write ran.
+    """
+    wanted = await _upcoming_entries({})
+    indexed = {}
+    async for entry in get_db().upcoming_events.find({}, {"_id": 0, "event_id": 1, "cells": 1}):
+        indexed[entry['event_id']] = entry.get('cells', [])
+
+    candidates = [
+        event_id for event_id in set(wanted) | set(indexed)
+        if event_id not in wanted or indexed.get(event_id) != wanted[event_id]['cells']
+    ]
+    if not candidates:
+        return 0, 0
+
+    current = await _upcoming_entries({"id": {"$in": candidates}})
+    upserted = [
+        event_id for event_id, entry in current.items()
+        if indexed.get(event_id) != entry['cells']
+    ]
+    stale = [event_id for event_id in candidates if event_id in indexed and event_id not in current]
+    requests = [
+        ReplaceOne({"event_id": event_id}, current[event_id], upsert=True) for event_id in upserted
+    ] + ([DeleteMany({"event_id": {"$in": stale}})] if stale else [])
+    if requests:
+        await get_db().upcoming_events.bulk_write(requests, ordered=False)
+
+    if upserted:
+        still_active = await _upcoming_entries({"id": {"$in": upserted}})
+        gone = [event_id for event_id in upserted if event_id not in still_active]
+        if gone:
+            await get_db().upcoming_events.delete_many({"event_id": {"$in": gone}})
+    return len(upserted), len(stale)
+
+async def acquire_lease(name: str, seconds: float) -> bool:
+    """Take a named lease shared by all workers; False if another holder's lease is still valid"""
+    now = datetime.now(timezone.utc)
+    try:
+        await get_db().locks.find_one_and_update(
+            {"_id": name, "expires_at": {"$lt": now}},
+            {"$set": {"expires_at": now + timedelta(seconds=seconds), "holder": WORKER_ID}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # The lease exists and has not expired, so the upsert collided with it
+        return False
+    return True
+
+# Keeps a reference to the background reconcile task until it finishes
+_upcoming_index_tasks: set = set()
+
+async def start_upcoming_index_reconcile():
+    """Reconcile the upcoming events index in the background, off the startup path
+
+    Only the first worker to start in each UPCOMING_RECONCILE_INTERVAL_S
+    does the reconcile; the others skip it after one lease lookup.
+    """
+    async def reconcile():
+        try:
+            if not await acquire_lease(UPCOMING_RECONCILE_LOCK, UPCOMING_RECONCILE_INTERVAL_S):
+                return
+            upserted, deleted = await reconcile_upcoming_index()
+            logger.info(f"Upcoming events index reconciled ({upserted} upserted, {deleted} deleted)")
+        except Exception as e:
+            logger.warning(f"Upcoming events index reconcile warning: {e}")
+
+    task = asyncio.create_task(reconcile())
+    _upcoming_index_tasks.add(task)
+    task.add_done_callback(_upcoming_index_tasks.discard)
+
 # Authentication
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     if not credentials:
         raise HTTPException(status_code=401, detail="Authentication required")
     
     token = credentials.credentials
-    user_doc = await db.users.find_one({"session_token": token})
+    user_doc = await get_db().users.find_one({"session_token": token})
     
     if not user_doc:
         raise HTTPException(status_code=401, detail="Invalid authentication token")
@@ -172,10 +581,10 @@ async def create_session_from_emergent_auth():
     }
     
     # Check if user already exists
-    existing_user = await db.users.find_one({"email": demo_user_data["email"]})
+    existing_user = await get_db().users.find_one({"email": demo_user_data["email"]})
     if existing_user:
         # Update session
-        await db.users.update_one(
+        await get_db().users.update_one(
             {"email": demo_user_data["email"]},
             {"$set": {
                 "session_token": demo_user_data["session_token"],
@@ -191,7 +600,7 @@ async def create_session_from_emergent_auth():
     else:
         # Create new user
         user_for_mongo = prepare_for_mongo(demo_user_data.copy())
-        await db.users.insert_one(user_for_mongo)
+        await get_db().users.insert_one(user_for_mongo)
         return User(**demo_user_data)
 
 @api_router.get("/auth/me", response_model=User)
@@ -202,7 +611,7 @@ async def get_me(current_user: User = Depends(get_current_user)):
 @api_router.post("/auth/logout")
 async def logout(current_user: User = Depends(get_current_user)):
     """Logout current user"""
-    await db.users.update_one(
+    await get_db().users.update_one(
         {"id": current_user.id},
         {"$unset": {"session_token": "", "session_expires": ""}}
     )
@@ -211,13 +620,54 @@ async def logout(current_user: User = Depends(get_current_user)):
 @api_router.get("/events", response_model=List[Event])
 async def get_events():
     """Get all active events"""
-    events = await db.events.find({"status": "active"}).to_list(length=100)
+    events = await get_db().events.find({"status": "active"}).to_list(length=100)
+    return [Event(**parse_from_mongo(event)) for event in events]
+
+async def hydrate_active_events(event_ids: List[str]) -> List[dict]:
+    """Active events for the given ids, in the same order; missing or inactive ones are dropped"""
+    events = await get_db().events.find(
+        {"id": {"$in": event_ids}, "status": "active"}
+    ).to_list(length=len(event_ids))
+    events_by_id = {event['id']: event for event in events}
+    return [events_by_id[event_id] for event_id in event_ids if event_id in events_by_id]
+
+@api_router.get("/events/upcoming-near", response_model=List[Event])
+async def get_upcoming_events_near(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(25, gt=0, le=500),
+    limit: int = Query(20, gt=0, le=100),
+):
+    """Get active upcoming events within radius_km of a point, soonest first"""
+    cursor = get_db().upcoming_events.find(
+        {
+            "cells": {"$in": nearby_cells(lat, lng, radius_km)},
+            "event_date": {"$gte": datetime.now(timezone.utc)},
+        },
+        {"_id": 0, "event_id": 1, "lat": 1, "lng": 1},
+    ).sort("event_date", 1)
+
+    # Soonest first: hydrate in-radius entries as they come and stop once
+    # limit active events are found, so orphaned entries cannot use up slots
+    events, pending = [], []
+    async for entry in cursor:
+        if distance_km(lat, lng, entry['lat'], entry['lng']) > radius_km:
+            continue
+        pending.append(entry['event_id'])
+        if len(pending) == limit - len(events):
+            events += await hydrate_active_events(pending)
+            pending = []
+            if len(events) == limit:
+                break
+    await cursor.close()
+    if pending:
+        events += await hydrate_active_events(pending)
     return [Event(**parse_from_mongo(event)) for event in events]
 
 @api_router.get("/events/{event_id}", response_model=Event)
 async def get_event(event_id: str):
     """Get a specific event by ID"""
-    event = await db.events.find_one({"id": event_id})
+    event = await get_db().events.find_one({"id": event_id})
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
     return Event(**parse_from_mongo(event))
@@ -237,13 +687,14 @@ async def create_event(event_data: EventCreate, current_user: User = Depends(get
     event = Event(**event_dict)
     event_for_mongo = prepare_for_mongo(event.dict())
     
-    await db.events.insert_one(event_for_mongo)
+    await get_db().events.insert_one(event_for_mongo)
+    await refresh_upcoming_index(event_for_mongo)
     return event
 
 @api_router.post("/events/{event_id}/join")
 async def join_event(event_id: str, current_user: User = Depends(get_current_user)):
     """Join an event"""
-    event = await db.events.find_one({"id": event_id})
+    event = await get_db().events.find_one({"id": event_id})
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
     
@@ -255,7 +706,7 @@ async def join_event(event_id: str, current_user: User = Depends(get_current_use
     if event.get('capacity') and len(event.get('participants', [])) >= event['capacity']:
         raise HTTPException(status_code=400, detail="Event is full")
     
-    await db.events.update_one(
+    await get_db().events.update_one(
         {"id": event_id},
         {"$push": {"participants": current_user.id}}
     )
@@ -265,11 +716,11 @@ async def join_event(event_id: str, current_user: User = Depends(get_current_use
 @api_router.delete("/events/{event_id}/leave")
 async def leave_event(event_id: str, current_user: User = Depends(get_current_user)):
     """Leave an event"""
-    event = await db.events.find_one({"id": event_id})
+    event = await get_db().events.find_one({"id": event_id})
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
     
-    await db.events.update_one(
+    await get_db().events.update_one(
         {"id": event_id},
         {"$pull": {"participants": current_user.id}}
     )
@@ -279,7 +730,7 @@ async def leave_event(event_id: str, current_user: User = Depends(get_current_us
 @api_router.delete("/events/{event_id}")
 async def delete_event(event_id: str, current_user: User = Depends(get_current_user)):
     """Delete an event (only creator can delete)"""
-    event = await db.events.find_one({"id": event_id})
+    event = await get_db().events.find_one({"id": event_id})
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
     
@@ -290,10 +741,11 @@ async def delete_event(event_id: str, current_user: User = Depends(get_current_u
         raise HTTPException(status_code=403, detail="Only the event creator can delete this event")
     
     # Delete the event
-    await db.events.delete_one({"id": event_id})
+    await get_db().events.delete_one({"id": event_id})
+    await remove_from_upcoming_index(event_id)
     
     # Delete all chat messages for this event
-    await db.chat_messages.delete_many({"event_id": event_id})
+    await get_db().chat_messages.delete_many({"event_id": event_id})
     
     return {"message": "Event deleted successfully"}
 
@@ -301,11 +753,11 @@ async def delete_event(event_id: str, current_user: User = Depends(get_current_u
 async def get_event_chat(event_id: str, current_user: User = Depends(get_current_user)):
     """Get chat messages for an event"""
     # Verify user has access to this event chat
-    event = await db.events.find_one({"id": event_id})
+    event = await get_db().events.find_one({"id": event_id})
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
     
-    messages = await db.chat_messages.find({"event_id": event_id}).sort("timestamp", 1).to_list(length=100)
+    messages = await get_db().chat_messages.find({"event_id": event_id}).sort("timestamp", 1).to_list(length=100)
     return [ChatMessage(**parse_from_mongo(msg)) for msg in messages]
 
 @api_router.post("/events/{event_id}/chat", response_model=ChatMessage)
@@ -316,7 +768,7 @@ async def send_chat_message(
 ):
     """Send a chat message to an event"""
     # Verify event exists
-    event = await db.events.find_one({"id": event_id})
+    event = await get_db().events.find_one({"id": event_id})
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
     
@@ -332,39 +784,126 @@ async def send_chat_message(
     chat_message = ChatMessage(**message_dict)
     message_for_mongo = prepare_for_mongo(chat_message.dict())
     
-    await db.chat_messages.insert_one(message_for_mongo)
+    await get_db().chat_messages.insert_one(message_for_mongo)
     return chat_message
 
 @api_router.get("/my-events", response_model=List[Event])
 async def get_my_events(current_user: User = Depends(get_current_user)):
     """Get events created by or joined by current user"""
-    created_events = await db.events.find({"created_by": current_user.id}).to_list(length=50)
-    joined_events = await db.events.find({"participants": current_user.id}).to_list(length=50)
+    created_events = await get_db().events.find({"created_by": current_user.id}).to_list(length=50)
+    joined_events = await get_db().events.find({"participants": current_user.id}).to_list(length=50)
     
     all_events = {event['id']: event for event in created_events + joined_events}
     return [Event(**parse_from_mongo(event)) for event in all_events.values()]
 
-# Include router
-app.include_router(api_router)
-
-# Create indexes on startup
-@app.on_event("startup")
-async def create_indexes():
-    """Create database indexes for better performance"""
+# Indexes created on startup, per collection: (keys, options)
+INDEXES = {
+    "users": [
+        ([("email", 1)], {"unique": True}),
+        ([("session_token", 1)], {}),
+    ],
+    "events": [
+        ([("id", 1)], {}),
+        ([("status", 1)], {}),
+        ([("event_type", 1)], {}),
+        ([("created_by", 1)], {}),
+    ],
+    "chat_messages": [
+        ([("event_id", 1), ("timestamp", 1)], {}),
+    ],
+    "upcoming_events": [
+        ([("event_id", 1)], {"unique": True}),
+        ([("cells", 1), ("event_date", 1)], {}),
+        # TTL index: MongoDB removes entries once their event_date has passed
+        ([("event_date", 1)], {"expireAfterSeconds": 0}),
+    ],
+}
+
+def _index_name(keys: list) -> str:
+    """Default MongoDB index name, e.g. event_id_1_timestamp_1"""
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+def _index_options_mismatch(info: dict, options: dict) -> dict:
+    """Options of an existing index that differ from INDEXES, as {option: (existing, expected)}"""
+    mismatch = {}
+    for option in set(options) | {"unique", "sparse"}:
+        existing, expected = info.get(option, False), options.get(option, False)
+        if existing != expected:
+            mismatch[option] = (existing, expected)
+    return mismatch
+
+async def _ensure_collection_indexes(name: str, indexes: list) -> int:
+    """Create the indexes missing from a collection, returning how many were created
+
+    Existing indexes are matched by name; one whose options differ from
+    INDEXES is left alone and logged, as it has to be dropped to change.
+    """
+    collection = get_db()[name]
+    existing = await collection.index_information()
+    missing = []
+    for keys, options in indexes:
+        index_name = _index_name(keys)
+        if index_name not in existing:
+            missing.append((keys, options))
+            continue
+        mismatch = _index_options_mismatch(existing[index_name], options)
+        if mismatch:
+            logger.warning(f"Index {name}.{index_name} exists with different options: {mismatch}")
+    await asyncio.gather(*(collection.create_index(keys, **options) for keys, options in missing))
+    return len(missing)
+
+async def create_indexes() -> int:
+    """Create database indexes for better performance, returning how many were created"""
+    indexes_started = time.perf_counter()
+    created = []
     try:
-        await db.users.create_index("email", unique=True)
-        await db.users.create_index("session_token")
-        await db.events.create_index("status")
-        await db.events.create_index("event_type")
-        await db.events.create_index("created_by")
-        await db.chat_messages.create_index([("event_id", 1), ("timestamp", 1)])
-        logger.info("Database indexes created successfully")
+        created = await asyncio.gather(
+            *(_ensure_collection_indexes(name, indexes) for name, indexes in INDEXES.items())
+        )
+        logger.info(f"Database indexes ready ({sum(created)} created)")
     except Exception as e:
         logger.warning(f"Index creation warning: {e}")
+    startup_timings['indexes'] = time.perf_counter() - indexes_started
+    return sum(created)
+
+async def log_startup_profile():
+    """Log how long each startup phase took"""
+    startup_timings['total'] = time.perf_counter() - _STARTED_AT
+    report = ", ".join(f"{phase}={seconds * 1000:.1f}ms" for phase, seconds in startup_timings.items())
+    logger.info(f"Startup profile: {report}")
 
-@app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
+    if _client is not None:
+        _client.close()
+
+def create_app() -> FastAPI:
+    """Build the FastAPI application"""
+    app_started = time.perf_counter()
+    app = FastAPI(title="TrailMeet API", description="API for outdoor events and adventures")
+
+    # CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    app.add_middleware(QueryProfilerMiddleware)
+
+    app.include_router(api_router)
+
+    app.add_event_handler("startup", create_indexes)
+    app.add_event_handler("startup", start_upcoming_index_reconcile)
+    app.add_event_handler("startup", log_startup_profile)
+    app.add_event_handler("shutdown", shutdown_db_client)
+
+    startup_timings['create_app'] = time.perf_counter() - app_started
+    return app
+
+startup_timings['module'] = time.perf_counter() - _STARTED_AT
+app = create_app()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,250 @@
+import asyncio
+import contextvars
+import functools
+import logging
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+
+
+def command_event(command_name, command, request_id=1, duration_micros=0):
+    return SimpleNamespace(
+        command_name=command_name,
+        command=command,
+        connection_id=("localhost", 27017),
+        request_id=request_id,
+        duration_micros=duration_micros,
+    )
+
+
+class TestSummarizePlan:
+    def test_collscan(self):
+        result = {"queryPlanner": {"winningPlan": {"stage": "COLLSCAN", "direction": "forward"}}}
+        assert server.summarize_plan(result) == "COLLSCAN"
+
+    def test_fetch_ixscan(self):
+        result = {"queryPlanner": {"winningPlan": {
+            "stage": "FETCH",
+            "inputStage": {"stage": "IXSCAN", "indexName": "status_1"},
+        }}}
+        assert server.summarize_plan(result) == "FETCH>IXSCAN"
+
+    def test_sbe_query_plan(self):
+        result = {"queryPlanner": {"winningPlan": {
+            "queryPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}},
+            "slotBasedPlan": {"slots": "..."},
+        }}}
+        assert server.summarize_plan(result) == "FETCH>IXSCAN"
+
+    def test_aggregate_cursor_stage(self):
+        result = {"stages": [
+            {"$cursor": {"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}}},
+            {"$group": {"_id": "$event_type"}},
+        ]}
+        assert server.summarize_plan(result) == "COLLSCAN"
+
+    def test_unknown_shape(self):
+        assert server.summarize_plan({}) == "unknown"
+
+
+class TestQueryProfile:
+    def test_records_commands_and_server_timing(self):
+        profile = server.QueryProfile()
+        profile.started(command_event("find", {"find": "events", "filter": {"id": "1"}, "lsid": {}, "$db": "test"}))
+        profile.finished(command_event("find", {}, duration_micros=1500))
+        profile.started(command_event("insert", {"insert": "chat_messages"}, request_id=2))
+        profile.finished(command_event("insert", {}, request_id=2, duration_micros=500), failed=True)
+
+        assert [entry["collection"] for entry in profile.commands] == ["events", "chat_messages"]
+        assert profile.commands[0]["spec"] == {"find": "events", "filter": {"id": "1"}}
+        assert profile.commands[1]["spec"] is None
+        assert profile.commands[1]["failed"] is True
+        assert profile.total_ms == pytest.approx(2.0)
+        assert profile.server_timing() == (
+            'mongo;dur=2.0;desc="2 commands", '
+            'mongo-0;dur=1.5;desc="find events", '
+            'mongo-1;dur=0.5;desc="insert chat_messages"'
+        )
+
+    def test_get_more_records_collection(self):
+        profile = server.QueryProfile()
+        profile.started(command_event("getMore", {"getMore": 123456789, "collection": "events"}))
+        profile.finished(command_event("getMore", {}, duration_micros=100))
+        assert profile.commands[0]["collection"] == "events"
+
+    def test_ignores_unmatched_finish(self):
+        profile = server.QueryProfile()
+        profile.finished(command_event("find", {}, duration_micros=100))
+        assert profile.commands == []
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("1", True), ("true", True), ("Yes", True), ("on", True),
+    ("0", False), ("false", False), ("", False), (None, False),
+])
+def test_is_truthy(value, expected):
+    assert server.is_truthy(value) is expected
+
+
+class TestQueryProfilerMiddleware:
+    @pytest.fixture
+    def client(self, monkeypatch):
+        monkeypatch.setattr(server, "QUERY_PROFILE_SAMPLE_RATE", 0.0)
+        monkeypatch.setattr(server, "QUERY_PROFILE_SERVER_TIMING", True)
+        return TestClient(server.create_app())
+
+    def test_not_profiled_by_default(self, client):
+        response = client.get("/api/")
+        assert response.status_code == 200
+        assert "server-timing" not in response.headers
+
+    def test_header_ignored_unless_allowed(self, client, monkeypatch):
+        monkeypatch.setattr(server, "QUERY_PROFILE_ALLOW_HEADER", False)
+        response = client.get("/api/", headers={"X-Query-Profile": "true"})
+        assert "server-timing" not in response.headers
+
+    def test_header_parsed_as_boolean(self, client, monkeypatch):
+        monkeypatch.setattr(server, "QUERY_PROFILE_ALLOW_HEADER", True)
+        assert "server-timing" not in client.get("/api/", headers={"X-Query-Profile": "0"}).headers
+        response = client.get("/api/", headers={"X-Query-Profile": "true"})
+        assert response.headers["server-timing"] == 'mongo;dur=0.0;desc="0 commands"'
+
+    def test_sampled_request_without_server_timing(self, client, monkeypatch):
+        monkeypatch.setattr(server, "QUERY_PROFILE_SAMPLE_RATE", 1.0)
+        monkeypatch.setattr(server, "QUERY_PROFILE_SERVER_TIMING", False)
+        response = client.get("/api/")
+        assert response.status_code == 200
+        assert "server-timing" not in response.headers
+
+
+def run_like_motor(fn, *args):
+    """Call fn on a worker thread with the caller's context copied, as Motor does"""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return loop.run_in_executor(None, functools.partial(context.run, fn, *args))
+
+
+async def issue_command(listener, command_name, command, request_id, duration_micros):
+    await run_like_motor(listener.started, command_event(command_name, command, request_id))
+    await run_like_motor(
+        listener.succeeded, command_event(command_name, command, request_id, duration_micros)
+    )
+
+
+class TestQueryProfiler:
+    def test_records_into_request_profile_from_executor_thread(self):
+        listener = server.QueryProfiler()
+        profile = server.QueryProfile()
+
+        async def request():
+            token = server.current_query_profile.set(profile)
+            try:
+                await issue_command(listener, "find", {"find": "events", "filter": {}}, 1, 2000)
+                await issue_command(listener, "getMore", {"getMore": 42, "collection": "events"}, 2, 300)
+            finally:
+                server.current_query_profile.reset(token)
+            # Outside the request nothing is recorded
+            await issue_command(listener, "find", {"find": "users"}, 3, 100)
+
+        asyncio.run(request())
+        assert [(entry["command"], entry["collection"]) for entry in profile.commands] == [
+            ("find", "events"), ("getMore", "events"),
+        ]
+        assert profile.total_ms == pytest.approx(2.3)
+
+    def test_logs_slow_commands_outside_profiled_requests(self, monkeypatch, caplog):
+        monkeypatch.setattr(server, "SLOW_QUERY_MS", 100)
+        listener = server.QueryProfiler()
+        with caplog.at_level(logging.WARNING, logger=server.logger.name):
+            listener.started(command_event("find", {"find": "events"}))
+            listener.succeeded(command_event("find", {}, duration_micros=99_000))
+            listener.failed(command_event("aggregate", {}, request_id=2, duration_micros=100_000))
+        assert caplog.messages == ["Slow query: aggregate took 100.0ms"]
+
+
+class FakeDatabase:
+    def __init__(self, result=None, error=None):
+        self.result, self.error = result, error
+        self.commands = []
+
+    async def command(self, command):
+        self.commands.append(command)
+        if self.error:
+            raise self.error
+        return self.result
+
+
+class TestLogSlowQueries:
+    def slow_profile(self):
+        profile = server.QueryProfile()
+        profile.started(command_event("find", {"find": "events", "filter": {"status": "active"}}))
+        profile.finished(command_event("find", {}, duration_micros=250_000))
+        profile.started(command_event("insert", {"insert": "chat_messages"}, request_id=2))
+        profile.finished(command_event("insert", {}, request_id=2, duration_micros=150_000))
+        profile.started(command_event("find", {"find": "users"}, request_id=3))
+        profile.finished(command_event("find", {}, request_id=3, duration_micros=1_000))
+        return profile
+
+    def test_explains_slow_commands(self, monkeypatch, caplog):
+        monkeypatch.setattr(server, "SLOW_QUERY_MS", 100)
+        database = FakeDatabase(result={"queryPlanner": {"winningPlan": {
+            "stage": "FETCH", "inputStage": {"stage": "IXSCAN"},
+        }}})
+        monkeypatch.setattr(server, "get_db", lambda: database)
+
+        with caplog.at_level(logging.WARNING, logger=server.logger.name):
+            asyncio.run(server.log_slow_queries("GET", "/api/events", self.slow_profile()))
+
+        assert database.commands == [{
+            "explain": {"find": "events", "filter": {"status": "active"}},
+            "verbosity": "queryPlanner",
+        }]
+        assert caplog.messages == [
+            "Slow query in GET /api/events: find events took 250.0ms, plan=FETCH>IXSCAN",
+            "Slow query in GET /api/events: insert chat_messages took 150.0ms, plan=n/a",
+        ]
+
+    def test_explain_failure_is_logged(self, monkeypatch, caplog):
+        monkeypatch.setattr(server, "SLOW_QUERY_MS", 200)
+        monkeypatch.setattr(server, "get_db", lambda: FakeDatabase(error=RuntimeError("not authorized")))
+
+        with caplog.at_level(logging.WARNING, logger=server.logger.name):
+            asyncio.run(server.log_slow_queries("GET", "/api/events", self.slow_profile()))
+
+        assert caplog.messages == [
+            "Slow query in GET /api/events: find events took 250.0ms, plan=explain failed: not authorized",
+        ]
+
+
+def test_middleware_profiles_commands_and_explains_slow_ones(monkeypatch, caplog):
+    monkeypatch.setattr(server, "QUERY_PROFILE_SAMPLE_RATE", 1.0)
+    monkeypatch.setattr(server, "QUERY_PROFILE_SERVER_TIMING", True)
+    monkeypatch.setattr(server, "SLOW_QUERY_MS", 100)
+    database = FakeDatabase(result={"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}})
+    monkeypatch.setattr(server, "get_db", lambda: database)
+    listener = server.QueryProfiler()
+
+    app = server.create_app()
+
+    @app.get("/profiled")
+    async def profiled():
+        await issue_command(listener, "find", {"find": "events", "filter": {}}, 1, 150_000)
+        await issue_command(listener, "insert", {"insert": "chat_messages"}, 2, 2_000)
+        return {}
+
+    with caplog.at_level(logging.INFO, logger=server.logger.name):
+        with TestClient(app) as client:
+            response = client.get("/profiled")
+            # Let the background explain finish before the client's loop stops
+            client.portal.call(asyncio.sleep, 0.05)
+
+    assert response.headers["server-timing"] == (
+        'mongo;dur=152.0;desc="2 commands", '
+        'mongo-0;dur=150.0;desc="find events", '
+        'mongo-1;dur=2.0;desc="insert chat_messages"'
+    )
+    assert "Query profile GET /profiled: 2 commands, 152.0ms" in caplog.messages
+    assert "Slow query in GET /profiled: find events took 150.0ms, plan=COLLSCAN" in caplog.messages
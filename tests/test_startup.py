@@ -0,0 +1,43 @@
+import asyncio
+import logging
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import server
+
+
+@pytest.fixture
+def db(monkeypatch):
+    database = AsyncMongoMockClient()["trailmeet_test"]
+    monkeypatch.setattr(server, "_db", database)
+    return database
+
+
+def test_index_name():
+    assert server._index_name([("event_id", 1), ("timestamp", 1)]) == "event_id_1_timestamp_1"
+
+
+def test_create_indexes_skips_existing(db):
+    total = sum(len(indexes) for indexes in server.INDEXES.values())
+    assert asyncio.run(server.create_indexes()) == total
+    assert asyncio.run(server.create_indexes()) == 0
+
+    info = asyncio.run(db.users.index_information())
+    assert info["email_1"]["unique"] is True
+    assert "indexes" in server.startup_timings
+
+
+def test_create_indexes_warns_on_option_mismatch(db, caplog):
+    asyncio.run(db.users.create_index("email"))
+
+    with caplog.at_level(logging.WARNING, logger=server.logger.name):
+        created = asyncio.run(server.create_indexes())
+
+    assert created == sum(len(indexes) for indexes in server.INDEXES.values()) - 1
+    assert "Index users.email_1 exists with different options: {'unique': (False, True)}" in caplog.text
+
+
+def test_index_options_mismatch():
+    assert server._index_options_mismatch({"key": [("a", 1)], "unique": True}, {"unique": True}) == {}
+    assert server._index_options_mismatch({"key": [("a", 1)], "unique": True}, {}) == {"unique": (True, False)}
@@ -0,0 +1,245 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+import server
+
+DENVER = (39.7392, -104.9903)
+
+
+def make_event(event_id, lat, lng, days_ahead, status="active"):
+    event = server.Event(
+        id=event_id,
+        title=f"Event {event_id}",
+        description="Trail run",
+        location=server.EventLocation(lat=lat, lng=lng, address="Somewhere"),
+        event_date=datetime.now(timezone.utc) + timedelta(days=days_ahead),
+        event_type="running",
+        created_by="user-1",
+        status=status,
+    )
+    return server.prepare_for_mongo(event.dict())
+
+
+@pytest.fixture
+def db(monkeypatch):
+    database = AsyncMongoMockClient()["trailmeet_test"]
+    monkeypatch.setattr(server, "_db", database)
+    return database
+
+
+async def add_events(db, events, index=True):
+    for event in events:
+        await db.events.insert_one(dict(event))
+        if index:
+            await server.refresh_upcoming_index(event)
+
+
+class TestGeohash:
+    def test_known_vector(self):
+        assert server.geohash_encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+
+    def test_cell_size(self):
+        height, width = server.geohash_cell_size(5)
+        assert height == pytest.approx(180 / 2 ** 12)
+        assert width == pytest.approx(360 / 2 ** 13)
+
+    def test_cover_across_antimeridian(self):
+        cells = server.nearby_cells(0.0, 179.99, 50)
+        # East of the antimeridian is the far west of the geohash grid
+        assert server.geohash_encode(0.1, -179.9, len(cells[0])) in cells
+        assert server.geohash_encode(-0.1, 179.9, len(cells[0])) in cells
+        assert all(len(cell) == len(cells[0]) for cell in cells)
+
+    def test_cover_near_pole_spans_all_longitudes(self):
+        cells = server.geohash_cover(89.9, 0.0, 50, 1)
+        assert len(cells) == 8
+        assert server.geohash_encode(89.8, 179.0, 1) in cells
+
+    @pytest.mark.parametrize("lat, radius_km, precision", [
+        (0.0, 0.1, 7),
+        (40.0, 1, 6),
+        (40.0, 25, 4),
+        (40.0, 500, 2),
+        (80.0, 500, 1),
+    ])
+    def test_precision_for_radius(self, lat, radius_km, precision):
+        cells = server.nearby_cells(lat, 10.0, radius_km)
+        assert len(cells[0]) == precision
+        assert len(cells) <= server.MAX_NEARBY_CELLS
+
+    def test_cover_limit(self):
+        assert server.geohash_cover(40.0, 10.0, 500, 7, max_cells=16) is None
+
+    def test_distance(self):
+        assert server.distance_km(0, 0, 0, 1) == pytest.approx(111.195, rel=1e-4)
+        assert server.distance_km(*DENVER, *DENVER) == 0
+
+
+class TestUpcomingIndex:
+    def test_entry_skips_past_and_inactive_events(self):
+        assert server.upcoming_entry(make_event("past", *DENVER, -1)) is None
+        assert server.upcoming_entry(make_event("cancelled", *DENVER, 1, status="cancelled")) is None
+        entry = server.upcoming_entry(make_event("next", *DENVER, 1))
+        assert entry["cells"] == [entry["cells"][-1][:p] for p in server.UPCOMING_PRECISIONS]
+
+    def test_reconcile_compares_event_ids(self, db):
+        events = [make_event(str(i), *DENVER, days) for i, days in enumerate([1, 2, -1])]
+        bad = make_event("bad", *DENVER, 3)
+        bad["event_date"] = "not a date"
+
+        async def scenario():
+            await add_events(db, events[:1])
+            await add_events(db, events[1:] + [bad], index=False)
+            await db.upcoming_events.insert_one({"event_id": "deleted", "cells": []})
+            result = await server.reconcile_upcoming_index()
+            ids = sorted([entry["event_id"] async for entry in db.upcoming_events.find()])
+            return result, ids
+
+        result, ids = asyncio.run(scenario())
+        assert result == (1, 1)
+        assert ids == ["0", "1"]
+
+
+class HookedDatabase:
+    """Database whose upcoming_events runs a hook before its first find or bulk_write"""
+
+    def __init__(self, db, on_find=None, on_bulk_write=None):
+        self.db, self.on_find, self.on_bulk_write = db, on_find, on_bulk_write
+
+    def __getattr__(self, name):
+        if name == "upcoming_events":
+            return HookedCollection(self, self.db.upcoming_events)
+        return getattr(self.db, name)
+
+
+class HookedCollection:
+    def __init__(self, database, collection):
+        self.database, self.collection = database, collection
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def find(self, *args, **kwargs):
+        hook, self.database.on_find = self.database.on_find, None
+        cursor = self.collection.find(*args, **kwargs)
+
+        async def documents():
+            if hook:
+                await hook()
+            async for document in cursor:
+                yield document
+        return documents()
+
+    async def bulk_write(self, *args, **kwargs):
+        hook, self.database.on_bulk_write = self.database.on_bulk_write, None
+        if hook:
+            await hook()
+        return await self.collection.bulk_write(*args, **kwargs)
+
+
+async def delete_event(db, event_id):
+    # Same order as the delete route: the event first, then its entry
+    await db.events.delete_one({"id": event_id})
+    await server.remove_from_upcoming_index(event_id)
+
+
+class TestReconcileRaces:
+    def indexed_ids(self, db):
+        async def ids():
+            return sorted([entry["event_id"] async for entry in db.upcoming_events.find()])
+        return asyncio.run(ids())
+
+    def test_event_created_between_scans_is_kept(self, db, monkeypatch):
+        asyncio.run(add_events(db, [make_event("existing", *DENVER, 1)]))
+        hooked = HookedDatabase(db, on_find=lambda: add_events(db, [make_event("new", *DENVER, 2)]))
+        monkeypatch.setattr(server, "get_db", lambda: hooked)
+
+        assert asyncio.run(server.reconcile_upcoming_index()) == (0, 0)
+        assert self.indexed_ids(db) == ["existing", "new"]
+
+    def test_event_deleted_between_scans_is_not_upserted(self, db, monkeypatch):
+        asyncio.run(add_events(db, [make_event("unindexed", *DENVER, 1)], index=False))
+        hooked = HookedDatabase(db, on_find=lambda: delete_event(db, "unindexed"))
+        monkeypatch.setattr(server, "get_db", lambda: hooked)
+
+        assert asyncio.run(server.reconcile_upcoming_index()) == (0, 0)
+        assert self.indexed_ids(db) == []
+
+    def test_event_deleted_during_write_is_removed_again(self, db, monkeypatch):
+        asyncio.run(add_events(db, [make_event("unindexed", *DENVER, 1)], index=False))
+        hooked = HookedDatabase(db, on_bulk_write=lambda: delete_event(db, "unindexed"))
+        monkeypatch.setattr(server, "get_db", lambda: hooked)
+
+        asyncio.run(server.reconcile_upcoming_index())
+        assert self.indexed_ids(db) == []
+
+
+def test_reconcile_lease_is_taken_once_per_interval(db):
+    async def scenario():
+        first = await server.acquire_lease("reconcile", 3600)
+        second = await server.acquire_lease("reconcile", 3600)
+        await db.locks.update_one(
+            {"_id": "reconcile"}, {"$set": {"expires_at": datetime.now(timezone.utc) - timedelta(seconds=1)}}
+        )
+        after_expiry = await server.acquire_lease("reconcile", 3600)
+        return first, second, after_expiry
+
+    assert asyncio.run(scenario()) == (True, False, True)
+
+
+class TestUpcomingNearEndpoint:
+    def test_radius_and_date_ordering(self, db):
+        lat, lng = DENVER
+        asyncio.run(add_events(db, [
+            make_event("later", lat + 0.05, lng, 5),
+            make_event("soonest", lat, lng + 0.05, 1),
+            make_event("middle", lat - 0.1, lng, 3),
+            make_event("too-far", lat + 1.0, lng, 2),
+            make_event("past", lat, lng, -1),
+            make_event("cancelled", lat, lng, 1, status="cancelled"),
+        ]))
+        client = TestClient(server.create_app())
+
+        response = client.get("/api/events/upcoming-near", params={"lat": lat, "lng": lng, "radius_km": 25})
+        assert response.status_code == 200
+        assert [event["id"] for event in response.json()] == ["soonest", "middle", "later"]
+
+        response = client.get("/api/events/upcoming-near", params={"lat": lat, "lng": lng, "radius_km": 25, "limit": 2})
+        assert [event["id"] for event in response.json()] == ["soonest", "middle"]
+
+    def test_many_far_candidates_do_not_crowd_out_nearby(self, db, monkeypatch):
+        lat, lng = DENVER
+        # Coarse cells put far-away events in the searched block; the nearby
+        # event comes last by date and must still be found
+        monkeypatch.setattr(server, "MAX_NEARBY_CELLS", 1)
+        far = [make_event(f"far-{i}", lat + 0.5, lng + 0.5, 1 + i / 100) for i in range(100)]
+        asyncio.run(add_events(db, far + [make_event("near", lat, lng, 10)]))
+        client = TestClient(server.create_app())
+
+        response = client.get("/api/events/upcoming-near", params={"lat": lat, "lng": lng, "radius_km": 5, "limit": 1})
+        assert [event["id"] for event in response.json()] == ["near"]
+
+    def test_orphaned_and_inactive_entries_do_not_use_up_slots(self, db):
+        lat, lng = DENVER
+
+        async def setup():
+            await add_events(db, [
+                make_event("orphan", lat, lng, 1),
+                make_event("now-cancelled", lat, lng, 2),
+                make_event("first", lat, lng, 3),
+                make_event("second", lat, lng, 4),
+                make_event("third", lat, lng, 5),
+            ])
+            # Entries left behind without going through the index helpers
+            await db.events.delete_one({"id": "orphan"})
+            await db.events.update_one({"id": "now-cancelled"}, {"$set": {"status": "cancelled"}})
+
+        asyncio.run(setup())
+        client = TestClient(server.create_app())
+
+        response = client.get("/api/events/upcoming-near", params={"lat": lat, "lng": lng, "limit": 2})
+        assert [event["id"] for event in response.json()] == ["first", "second"]